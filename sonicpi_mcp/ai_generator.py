@@ -1,16 +1,105 @@
 """AI-powered music code generation for natural language requests."""
 
+import hashlib
+import importlib.util
+import logging
 import os
 import re
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from .patterns import get_pattern, list_patterns
 
-from .patterns import get_pattern, list_patterns, get_pattern_description
+logger = logging.getLogger(__name__)
+
+# The openai SDK is slow to import, so only check that it is installed here
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+
+_BPM_RE = re.compile(r"(\d+)\s*bpm")
+# Words that explicitly ask for AI generation instead of the built-in patterns
+_AI_REQUEST_RE = re.compile(r"\b(?:ai|gpt|openai)\b")
+# Opening ```/```ruby fence at the start or closing fence at the end of a completion
+_FENCE_RE = re.compile(r"\A\s*```(?:ruby|rb)?|```\s*\Z")
+
+# Keyword tables used to detect musical elements in a request
+GENRE_KEYWORDS = {
+    "rock": frozenset({"rock", "metal", "punk"}),
+    "jazz": frozenset({"jazz", "swing", "bebop"}),
+    "techno": frozenset({"techno", "electronic", "edm", "house"}),
+    "hip_hop": frozenset({"hip hop", "hip-hop", "rap", "trap"}),
+    "pop": frozenset({"pop", "commercial"}),
+    "blues": frozenset({"blues", "country"}),
+    "funk": frozenset({"funk", "funky"})
+}
+
+INSTRUMENT_KEYWORDS = {
+    "drums": frozenset({"drum", "beat", "rhythm", "percussion"}),
+    "bass": frozenset({"bass", "bassline"}),
+    "piano": frozenset({"piano", "keys", "keyboard"}),
+    "guitar": frozenset({"guitar"}),
+    "synth": frozenset({"synth", "synthesizer", "electronic"})
+}
+
+# Instruments that get a chord progression in pattern-based generation
+CHORD_INSTRUMENTS = frozenset({"piano", "guitar", "synth"})
+
+MOOD_KEYWORDS = {
+    "energetic": frozenset({"fast", "energetic", "upbeat", "intense"}),
+    "calm": frozenset({"slow", "chill", "relaxed", "calm"})
+}
+
+
+def _build_keyword_index() -> Tuple["re.Pattern[str]", Dict[str, FrozenSet[Tuple[str, str]]]]:
+    """Build a single-pass keyword matcher and a keyword -> (category, value) map."""
+    hits: Dict[str, Set[Tuple[str, str]]] = {}
+    for category, table in (("genre", GENRE_KEYWORDS),
+                            ("instrument", INSTRUMENT_KEYWORDS),
+                            ("mood", MOOD_KEYWORDS)):
+        for value, keywords in table.items():
+            for keyword in keywords:
+                hits.setdefault(keyword, set()).add((category, value))
+    
+    # Only the longest keyword is reported at a given offset, so it also
+    # carries the hits of every shorter keyword it starts with
+    for keyword, keyword_hits in hits.items():
+        for other, other_hits in hits.items():
+            if other != keyword and keyword.startswith(other):
+                keyword_hits |= other_hits
+    
+    # A lookahead lets matches overlap (e.g. "beat" inside "upbeat")
+    alternation = "|".join(map(re.escape, sorted(hits, key=len, reverse=True)))
+    return re.compile(f"(?=({alternation}))"), {kw: frozenset(h) for kw, h in hits.items()}
+
+
+_KEYWORD_RE, _KEYWORD_HITS = _build_keyword_index()
+
+SYSTEM_PROMPT = (
+    "You are an elite Sonic Pi producer. Generate multi-layered code with live_loops, "
+    "with_fx chains, advanced synths (:blade, :dsaw, :fm, :prophet, :tb303) and "
+    "sophisticated harmony. Output raw Ruby only."
+)
+
+# Models in order of preference; the next one is only tried when the previous fails
+AI_MODELS = ["gpt-5", "gpt-4o", "gpt-4-turbo", "gpt-4"]
+
+# Maximum number of AI completions kept in memory
+COMPLETION_CACHE_SIZE = 256
+
+# Ultimate fallback - simple beat
+FALLBACK_CODE = """
+use_bpm 120
+live_loop :simple_beat do
+  sample :bd_haus
+  sleep 1
+  sample :sn_dub
+  sleep 1
+end
+""".strip()
+
+
+def _strip_code_fences(content: str) -> str:
+    """Remove markdown code fences wrapped around generated code."""
+    return _FENCE_RE.sub("", content).strip()
 
 
 class MusicAI:
@@ -20,15 +109,18 @@ class MusicAI:
         """Initialize the music AI system."""
         self.openai_client = None
         self.patterns = list_patterns()
+        self._completion_cache: "OrderedDict[str, str]" = OrderedDict()
         
         # Initialize OpenAI if available and API key is set
-        if OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if OPENAI_AVAILABLE and api_key:
             try:
-                self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                from openai import OpenAI
+                self.openai_client = OpenAI(api_key=api_key)
             except Exception:
                 self.openai_client = None
     
-    def parse_request(self, request: str) -> Dict[str, any]:
+    def parse_request(self, request: str) -> Dict[str, Any]:
         """Parse a natural language music request."""
         request_lower = request.lower()
         
@@ -42,51 +134,39 @@ class MusicAI:
             "complexity": "medium"
         }
         
-        # Detect genres
-        genre_patterns = {
-            "rock": ["rock", "metal", "punk"],
-            "jazz": ["jazz", "swing", "bebop"],
-            "techno": ["techno", "electronic", "edm", "house"],
-            "hip_hop": ["hip hop", "hip-hop", "rap", "trap"],
-            "pop": ["pop", "commercial"],
-            "blues": ["blues", "country"],
-            "funk": ["funk", "funky"]
-        }
+        # Scan the request once and collect every (category, value) hit
+        hits = set()
+        for match in _KEYWORD_RE.finditer(request_lower):
+            hits |= _KEYWORD_HITS[match.group(1)]
         
-        for genre, keywords in genre_patterns.items():
-            if any(keyword in request_lower for keyword in keywords):
+        # Detect genres
+        for genre in GENRE_KEYWORDS:
+            if ("genre", genre) in hits:
                 elements["genre"] = genre
                 break
         
         # Detect instruments
-        instrument_patterns = {
-            "drums": ["drum", "beat", "rhythm", "percussion"],
-            "bass": ["bass", "bassline"],
-            "piano": ["piano", "keys", "keyboard"],
-            "guitar": ["guitar"],
-            "synth": ["synth", "synthesizer", "electronic"]
-        }
-        
-        for instrument, keywords in instrument_patterns.items():
-            if any(keyword in request_lower for keyword in keywords):
+        for instrument in INSTRUMENT_KEYWORDS:
+            if ("instrument", instrument) in hits:
                 elements["instruments"].append(instrument)
         
         # Extract BPM
-        bpm_match = re.search(r'(\d+)\s*bpm', request_lower)
+        bpm_match = _BPM_RE.search(request_lower)
         if bpm_match:
             elements["bpm"] = int(bpm_match.group(1))
         
         # Detect mood/energy
-        if any(word in request_lower for word in ["fast", "energetic", "upbeat", "intense"]):
-            elements["mood"] = "energetic"
-        elif any(word in request_lower for word in ["slow", "chill", "relaxed", "calm"]):
-            elements["mood"] = "calm"
+        for mood in MOOD_KEYWORDS:
+            if ("mood", mood) in hits:
+                elements["mood"] = mood
+                break
         
         return elements
     
-    def generate_pattern_based_code(self, elements: Dict[str, any]) -> Optional[str]:
+    def generate_pattern_based_code(self, elements: Dict[str, Any]) -> Optional[str]:
         """Generate code using predefined patterns."""
         code_parts = []
+        instruments = set(elements["instruments"])
         
         # Set BPM if specified
         bpm = elements.get("bpm", 120)
@@ -96,21 +176,21 @@ class MusicAI:
             bpm = 80
         
         # Add drum pattern if requested
-        if "drums" in elements["instruments"] or "beat" in str(elements):
+        if "drums" in instruments:
             genre = elements.get("genre", "rock")
             drum_code = get_pattern("drums", genre, bpm=bpm)
             if drum_code:
                 code_parts.append(drum_code)
         
         # Add bass pattern
-        if "bass" in elements["instruments"]:
+        if "bass" in instruments:
             genre = elements.get("genre", "rock")
             bass_code = get_pattern("bass", genre)
             if bass_code:
                 code_parts.append(bass_code)
         
         # Add chord progression
-        if any(inst in elements["instruments"] for inst in ["piano", "guitar", "synth"]):
+        if CHORD_INSTRUMENTS & instruments:
             genre = elements.get("genre", "pop")
             chord_code = get_pattern("chords", genre)
             if chord_code:
@@ -118,136 +198,127 @@ class MusicAI:
         
         return "\n\n".join(code_parts) if code_parts else None
     
-    def generate_ai_code(self, request: str, elements: Dict[str, any]) -> Optional[str]:
+    def _build_prompt(self, request: str, elements: Dict[str, Any]) -> str:
+        """Build the user prompt sent to OpenAI: the request plus detected elements."""
+        detected = {
+            name: elements[name]
+            for name in ("genre", "instruments", "bpm", "mood")
+            if elements.get(name)
+        }
+        return f"{request}\nelements={detected}"
+    
+    def _completion_cache_key(self, request: str, elements: Dict[str, Any]) -> str:
+        """Hash the full prompt for a request, normalizing case and whitespace."""
+        normalized = " ".join(request.lower().split())
+        prompt = self._build_prompt(normalized, elements)
+        return hashlib.blake2b(f"{SYSTEM_PROMPT}\0{prompt}".encode(), digest_size=16).hexdigest()
+    
+    def _store_completion(self, cache_key: str, content: str) -> None:
+        """Remember a completion, evicting the least recently used entry when full."""
+        self._completion_cache[cache_key] = content
+        self._completion_cache.move_to_end(cache_key)
+        if len(self._completion_cache) > COMPLETION_CACHE_SIZE:
+            self._completion_cache.popitem(last=False)
+    
+    def _create_completion(self, model: str, prompt: str) -> Any:
+        """Request a completion from a single model."""
+        if model == "gpt-5":
+            # GPT-5 uses max_completion_tokens, which also counts its reasoning tokens
+            limits = {
+                "max_completion_tokens": 4000,
+                "temperature": 1.0  # GPT-5 only supports default temperature
+            }
+        else:
+            limits = {
+                "max_tokens": 1500,
+                "temperature": 0.9  # High creativity for musical variety and sophistication
+            }
+        return self.openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            **limits
+        )
+    
+    def _request_completion(self, prompt: str) -> Optional[Any]:
+        """Try each model in order of preference and return the first success."""
+        # One request at a time: every started completion is billed, even if unused
+        for model in AI_MODELS:
+            try:
+                response = self._create_completion(model, prompt)
+            except Exception as e:
+                logger.warning("Failed to use %s: %s", model, e)
+                continue
+            logger.info("Successfully used %s for AI generation", model)
+            return response
+        
+        logger.error("All AI models failed, falling back to patterns")
+        return None
+    
+    def generate_ai_code(self, request: str, elements: Dict[str, Any]) -> Optional[str]:
         """Generate code using OpenAI if available."""
         if not self.openai_client:
             return None
         
+        cache_key = self._completion_cache_key(request, elements)
+        cached = self._completion_cache.get(cache_key)
+        if cached is not None:
+            self._completion_cache.move_to_end(cache_key)
+            return cached
+        
         try:
-            # Create a prompt for Sonic Pi code generation
-            prompt = f"""
-Generate professional Sonic Pi code for this music request: "{request}"
-
-Musical elements detected:
-- Genre: {elements.get('genre', 'not specified')}
-- Instruments: {', '.join(elements['instruments']) if elements['instruments'] else 'not specified'}
-- BPM: {elements.get('bpm', 'not specified')}
-- Mood: {elements.get('mood', 'not specified')}
-
-Elite Professional Requirements:
-1. Generate world-class, multi-layered Sonic Pi Ruby code with studio-quality production
-2. Use 5+ live_loop structures for complex, sophisticated arrangements
-3. Include advanced synths (:blade, :dsaw, :fm, :prophet, :tb303, :saw, :piano, etc.)
-4. Add professional effects chains (reverb, echo, distortion, filters, compression)
-5. Create sophisticated musical progressions with advanced harmony
-6. Use proper jazz/classical chord voicings and walking bass lines
-7. Include dynamic amplitude, effect control, and musical expression
-8. Make it sound like a professional studio production
-9. Use precise timing with sleep commands and musical phrasing
-10. Add complex musical structure, form, and development
-
-Elite Techniques to Master:
-- Multiple live_loop layers (drums, bass, melody, pads, effects, percussion)
-- Complex with_fx chains for professional studio sound
-- Advanced chord progressions (ii-V-I, jazz standards, modal harmony)
-- Sophisticated sample manipulation with rate, amp, and filter parameters
-- Dynamic control, musical expression, and human-like performance
-- Advanced rhythmic patterns (swing, polyrhythms, complex time signatures)
-- Professional arrangement techniques (intro, verse, chorus, bridge, outro)
-- Musical development and variation throughout the composition
-
-Return only the Sonic Pi code, no explanations.
-"""
-            
-            # Try the most advanced models first, with fallbacks
-            models_to_try = ["gpt-5", "gpt-4o", "gpt-4-turbo", "gpt-4"]
-            response = None
-            
-            for model in models_to_try:
-                try:
-                    # Use max_completion_tokens for GPT-5, max_tokens for others
-                    if model == "gpt-5":
-                        response = self.openai_client.chat.completions.create(
-                            model=model,
-                            messages=[
-                                {"role": "system", "content": "You are an elite Sonic Pi music producer and composer with deep expertise in music theory, jazz harmony, electronic music production, and advanced programming. You create sophisticated, multi-layered musical compositions that rival professional studio productions. Your code demonstrates mastery of: complex chord progressions, advanced synthesis techniques, professional effects chains, dynamic musical arrangements, and sophisticated rhythmic patterns. Generate code that sounds like it was created by a world-class music producer."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            max_completion_tokens=4000,  # GPT-5 uses max_completion_tokens
-                            temperature=1.0   # GPT-5 only supports default temperature
-                        )
-                    else:
-                        response = self.openai_client.chat.completions.create(
-                            model=model,
-                            messages=[
-                                {"role": "system", "content": "You are an elite Sonic Pi music producer and composer with deep expertise in music theory, jazz harmony, electronic music production, and advanced programming. You create sophisticated, multi-layered musical compositions that rival professional studio productions. Your code demonstrates mastery of: complex chord progressions, advanced synthesis techniques, professional effects chains, dynamic musical arrangements, and sophisticated rhythmic patterns. Generate code that sounds like it was created by a world-class music producer."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            max_tokens=4000,  # Other models use max_tokens
-                            temperature=0.9   # High creativity for musical variety and sophistication
-                        )
-                    print(f"Successfully used {model} for AI generation")
-                    break
-                except Exception as e:
-                    print(f"Failed to use {model}: {e}")
-                    continue
-            
+            response = self._request_completion(self._build_prompt(request, elements))
             if not response:
-                print("All AI models failed, falling back to patterns")
                 return None
             
-            content = response.choices[0].message.content.strip()
-            
-            # Remove markdown code blocks if present
-            if content.startswith("```ruby"):
-                content = content[7:]  # Remove ```ruby
-            elif content.startswith("```"):
-                content = content[3:]   # Remove ```
-            
-            if content.endswith("```"):
-                content = content[:-3]  # Remove trailing ```
-            
-            return content.strip()
+            content = _strip_code_fences(response.choices[0].message.content)
+            self._store_completion(cache_key, content)
+            return content
         
         except Exception as e:
-            print(f"AI generation failed: {e}")
+            logger.error("AI generation failed: %s", e)
             return None
     
-    def generate_music_code(self, request: str) -> Tuple[str, str]:
+    def generate_music_code(self, request: str,
+                            elements: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
         """
         Generate Sonic Pi code from a natural language request.
+        Pass already parsed `elements` to skip parsing the request again.
         Returns (code, method_used).
         """
-        elements = self.parse_request(request)
+        # Nothing to generate from, so don't spend an AI call on it
+        if not request or not request.strip():
+            return FALLBACK_CODE, "fallback"
+        
+        if elements is None:
+            elements = self.parse_request(request)
         
-        # Try AI generation first if available
+        # Patterns are instant, so prefer them unless AI was explicitly asked for
+        pattern_code = self.generate_pattern_based_code(elements)
+        if pattern_code and not _AI_REQUEST_RE.search(request.lower()):
+            return pattern_code, "patterns"
+        
+        # Try AI generation if available
         if self.openai_client:
             ai_code = self.generate_ai_code(request, elements)
             if ai_code:
                 return ai_code, "ai"
         
         # Fall back to pattern-based generation
-        pattern_code = self.generate_pattern_based_code(elements)
         if pattern_code:
             return pattern_code, "patterns"
         
-        # Ultimate fallback - simple beat
-        fallback_code = """
-use_bpm 120
-live_loop :simple_beat do
-  sample :bd_haus
-  sleep 1
-  sample :sn_dub
-  sleep 1
-end
-"""
-        return fallback_code.strip(), "fallback"
+        return FALLBACK_CODE, "fallback"
     
-    def suggest_improvements(self, request: str) -> List[str]:
+    def suggest_improvements(self, request: str,
+                             elements: Optional[Dict[str, Any]] = None) -> List[str]:
         """Suggest ways to improve or extend the musical request."""
         suggestions = []
         
-        elements = self.parse_request(request)
+        if elements is None:
+            elements = self.parse_request(request)
         
         if not elements["instruments"]:
             suggestions.append("Try specifying instruments like 'drums', 'bass', or 'piano'")
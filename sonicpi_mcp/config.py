@@ -2,7 +2,7 @@
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
@@ -11,6 +11,7 @@ class OscConfig(BaseModel):
     """OSC-related configuration."""
     host: str = Field(default="127.0.0.1", description="OSC server host")
     port: int = Field(default=4557, description="OSC server port")
+    cue_port: int = Field(default=4560, description="Sonic Pi cue port that run_code sends to")
     
     # Default OSC paths - these match Sonic Pi's defaults
     run_code_path: str = Field(default="/save-and-run-buffer", description="OSC path for run_code")
@@ -36,23 +37,39 @@ def load_config() -> Config:
     load_dotenv()
     
     # Allow environment variables to override defaults
+    env = os.environ
     osc_config = OscConfig(
-        host=os.getenv("SONICPI_OSC_HOST", "127.0.0.1"),
-        port=int(os.getenv("SONICPI_OSC_PORT", "4557")),
-        run_code_path=os.getenv("SONICPI_OSC_RUN_PATH", "/run-code"),
-        stop_all_path=os.getenv("SONICPI_OSC_STOP_PATH", "/stop-all-jobs"),
-        set_bpm_path=os.getenv("SONICPI_OSC_BPM_PATH", "/bpm"),
-        cue_path=os.getenv("SONICPI_OSC_CUE_PATH", "/cue")
+        host=env.get("SONICPI_OSC_HOST", "127.0.0.1"),
+        port=int(env.get("SONICPI_OSC_PORT", "4557")),
+        cue_port=int(env.get("SONICPI_OSC_CUE_PORT", "4560")),
+        run_code_path=env.get("SONICPI_OSC_RUN_PATH", "/run-code"),
+        stop_all_path=env.get("SONICPI_OSC_STOP_PATH", "/stop-all-jobs"),
+        set_bpm_path=env.get("SONICPI_OSC_BPM_PATH", "/bpm"),
+        cue_path=env.get("SONICPI_OSC_CUE_PATH", "/cue")
     )
     
     log_config = LogConfig(
-        max_entries=int(os.getenv("SONICPI_LOG_MAX_ENTRIES", "1000")),
-        level=os.getenv("SONICPI_LOG_LEVEL", "INFO")
+        max_entries=int(env.get("SONICPI_LOG_MAX_ENTRIES", "1000")),
+        level=env.get("SONICPI_LOG_LEVEL", "INFO")
     )
     
     return Config(osc=osc_config, logging=log_config)
 
 
+def _read_tail_lines(path: Path, max_lines: int, max_bytes: int = 8192) -> List[str]:
+    """Read the last lines of a file without loading the whole file."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = max(0, size - max_bytes)
+        f.seek(offset)
+        lines = f.read().decode("utf-8", errors="replace").splitlines()
+    
+    # The first line is likely cut in half when reading from the middle
+    if offset and lines:
+        lines = lines[1:]
+    return lines[-max_lines:]
+
+
 def discover_sonic_pi_port() -> Optional[int]:
     """Attempt to auto-discover Sonic Pi's OSC port from its session files."""
     # Common locations for Sonic Pi session info
@@ -65,11 +82,10 @@ def discover_sonic_pi_port() -> Optional[int]:
         if path.exists():
             try:
                 # Read the last few lines to find port info
-                with open(path) as f:
-                    for line in f.readlines()[-50:]:  # Check last 50 lines
-                        if "Server port" in line and ":" in line:
-                            port = line.split(":")[-1].strip()
-                            return int(port)
+                for line in _read_tail_lines(path, 50):  # Check last 50 lines
+                    if "Server port" in line and ":" in line:
+                        port = line.split(":")[-1].strip()
+                        return int(port)
             except (IOError, ValueError):
                 continue
     
@@ -0,0 +1,119 @@
+"""Ring buffer logging shared across the MCP server modules."""
+
+import logging
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from itertools import chain
+from typing import Iterable, List, Optional
+
+from .schemas import LogEntry
+
+
+class RingLogger:
+    """Ring buffer logger that maintains a fixed number of recent log entries."""
+    
+    def __init__(self, max_entries: int = 1000):
+        """Initialize the logger with a maximum number of entries."""
+        self.max_entries = max_entries
+        # Preallocated circular columns; slot i holds the (i mod max_entries)-th write.
+        # Timestamps are integer nanoseconds and only become float milliseconds on the way out.
+        self._timestamps = array("q", bytes(8 * max_entries))
+        self._levels: List[str] = [""] * max_entries
+        self._messages: List[str] = [""] * max_entries
+        self._written = 0
+        self._lock = threading.Lock()
+    
+    def log(self, level: str, message: str) -> None:
+        """Add a new log entry."""
+        if not self.max_entries:
+            return
+        ts = time.time_ns()
+        with self._lock:
+            slot = self._written % self.max_entries
+            self._timestamps[slot] = ts
+            self._levels[slot] = level
+            self._messages[slot] = message
+            self._written += 1
+    
+    def get_entries(self, since_ms: Optional[float] = None) -> List[LogEntry]:
+        """Retrieve log entries, optionally filtered by timestamp."""
+        with self._lock:
+            slots = self._slots_after(since_ms)
+            timestamps, levels, messages = self._timestamps, self._levels, self._messages
+            return [
+                LogEntry(ts=timestamps[i] / 1_000_000, level=levels[i], message=messages[i])
+                for i in slots
+            ]
+    
+    def _slots_after(self, since_ms: Optional[float]) -> Iterable[int]:
+        """Slots of the buffered entries newer than since_ms, oldest first."""
+        cap, written = self.max_entries, self._written
+        if since_ms is not None and math.isnan(since_ms):
+            return ()  # Nothing compares as after NaN
+        if written <= cap:
+            # Not wrapped yet: slots 0..written are in time order
+            start = 0 if since_ms is None else self._first_after(since_ms, 0, written)
+            return range(start, written)
+        
+        # Wrapped: the oldest entries run from head to the end, the newest from 0 to head.
+        # Entries are written in time order, so binary search whichever run holds the cutoff.
+        head = written % cap
+        if since_ms is not None and since_ms >= self._timestamps[cap - 1] / 1_000_000:
+            return range(self._first_after(since_ms, 0, head), head)
+        start = head if since_ms is None else self._first_after(since_ms, head, cap)
+        return chain(range(start, cap), range(head))
+    
+    def _first_after(self, since_ms: float, lo: int, hi: int) -> int:
+        """First slot in lo..hi whose timestamp, in milliseconds, is after since_ms."""
+        if math.isinf(since_ms):
+            return lo if since_ms < 0 else hi
+        
+        timestamps = self._timestamps
+        i = bisect_right(timestamps, math.floor(since_ms * 1_000_000), lo, hi)
+        # since_ms is a float, so the nanosecond cutoff can be a rounding step off
+        while i > lo and timestamps[i - 1] / 1_000_000 > since_ms:
+            i -= 1
+        while i < hi and timestamps[i] / 1_000_000 <= since_ms:
+            i += 1
+        return i
+
+
+class RingHandler(logging.Handler):
+    """Forward standard library log records into a RingLogger."""
+    
+    def __init__(self, ring: RingLogger):
+        """Initialize the handler with the ring buffer to write to."""
+        super().__init__()
+        self.ring = ring
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        """Append the formatted record to the ring buffer."""
+        try:
+            self.ring.log(record.levelname, record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+# Global logger instance
+logger = RingLogger()
+
+# Modules log through logging.getLogger(__name__); surface their records in tail_logs
+_package_logger = logging.getLogger(__package__)
+_package_logger.addHandler(RingHandler(logger))
+_package_logger.setLevel(logging.INFO)
+
+
+def set_level(level: str) -> None:
+    """
+    Set the minimum level recorded from the package's module loggers (e.g. "WARNING").
+    An unknown level name is logged and INFO is used instead.
+    """
+    name = str(level).upper()
+    # getLevelName maps known names to their number and returns a string otherwise
+    if not isinstance(logging.getLevelName(name), int):
+        _package_logger.warning("Unknown log level %r, using INFO", level)
+        name = "INFO"
+    _package_logger.setLevel(name)
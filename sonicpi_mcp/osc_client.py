@@ -1,143 +1,319 @@
 """OSC client for communicating with Sonic Pi."""
 
+import itertools
+import logging
+import os
 import re
+import socket
+import struct
 import subprocess
 import time
-import uuid
-from typing import Optional
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 
-from pythonosc.udp_client import SimpleUDPClient
 from pythonosc.osc_message_builder import OscMessageBuilder
 
 from .config import OscConfig
 
+logger = logging.getLogger(__name__)
+
+# Send buffer requested for OSC sockets, and the IP "low delay" type of service
+SEND_BUFFER_SIZE = 1 << 20
+IPTOS_LOWDELAY = 0x10
+
+# Kernel table of UDP sockets on Linux; addresses are little-endian hex
+PROC_NET_UDP = "/proc/net/udp"
+_LOCALHOST_HEX = "0100007F:"
+
+# An lsof line whose COMMAND (first column) names Sonic Pi, for a UDP socket on 127.0.0.1
+_SONIC_UDP_RE = re.compile(rb"^\S*(?i:sonic)\S*\s.*?UDP.*?127\.0\.0\.1:(\d+)")
+
+# Job ids only need to be unique per server process, so skip uuid4's urandom read
+_PID = os.getpid()
+_JOB_COUNTER = itertools.count(1)
+
+# How long a port discovery result is reused before running lsof again
+DISCOVERY_TTL = 30.0
+
+
+def _osc_string(value: str) -> bytes:
+    """Encode an OSC string: UTF-8, NUL terminated, padded to a multiple of 4 bytes."""
+    data = value.encode("utf-8")
+    return data + b"\0" * (4 - len(data) % 4)
+
+
+@lru_cache(maxsize=64)
+def _osc_prefix(address: str, type_tags: str) -> bytes:
+    """Encode the address and type tag string that start every OSC message."""
+    return _osc_string(address) + _osc_string("," + type_tags)
+
+
+# Big-endian 32-bit float, the encoding of an OSC "f" argument
+_pack_float = struct.Struct(">f").pack
+
+# Sonic Pi's listener live_loop syncs on this cue address
+_CODE_PREFIX = _osc_prefix("/mcp/code", "s")
+
+
+def _open_udp_socket(family: int) -> socket.socket:
+    """Open a UDP socket tuned for bursts of small, latency-sensitive datagrams."""
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        # Room for a burst of messages so sendto does not wait on a full queue
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, IPTOS_LOWDELAY)
+    except OSError:
+        # Both are hints; some platforms refuse them and the defaults still work
+        pass
+    return sock
+
+
+def find_sonic_pi_socket_port(ports_by_inode: Dict[str, int], skip_pid: int) -> Optional[int]:
+    """
+    Return the port of the first socket in ports_by_inode ("socket:[inode]" -> port)
+    held open by a process whose name contains "sonic", ignoring process skip_pid.
+    Linux only; reads /proc/<pid>/comm and the /proc/<pid>/fd links.
+    """
+    if not ports_by_inode:
+        return None
+    
+    # Only look at the file descriptors of processes named like Sonic Pi. Match the
+    # process name (as psutil's name() and lsof's COMMAND do), not the command line,
+    # which helpers launched from the Sonic Pi install path also match.
+    skip = str(skip_pid)
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit() or entry.name == skip:
+            continue
+        try:
+            with open(f"/proc/{entry.name}/comm", "rb") as f:
+                if b"sonic" not in f.read().lower():
+                    continue
+            fd_dir = f"/proc/{entry.name}/fd"
+            for fd in os.listdir(fd_dir):
+                port = ports_by_inode.get(os.readlink(f"{fd_dir}/{fd}"))
+                if port is not None:
+                    return port
+        except OSError:
+            # The process exited or belongs to another user
+            continue
+    
+    return None
+
+
+def _find_sonic_udp_port_proc() -> Optional[int]:
+    """
+    Find a UDP port on 127.0.0.1 owned by a Sonic Pi process by reading /proc directly.
+    Raises OSError when /proc/net/udp is not available.
+    """
+    # Map socket inode -> port for every UDP socket bound to 127.0.0.1
+    ports_by_inode = {}
+    with open(PROC_NET_UDP) as f:
+        next(f)  # Skip the header
+        for line in f:
+            fields = line.split()
+            local_address, inode = fields[1], fields[9]
+            if local_address.startswith(_LOCALHOST_HEX):
+                ports_by_inode[f"socket:[{inode}]"] = int(local_address[9:], 16)
+    
+    return find_sonic_pi_socket_port(ports_by_inode, os.getpid())
+
+
+def _find_sonic_udp_port_lsof() -> Optional[int]:
+    """Find a UDP port on 127.0.0.1 owned by a Sonic Pi process using lsof."""
+    result = subprocess.run(
+        ["lsof", "-i", "-P", "-n"], 
+        capture_output=True, 
+        timeout=3
+    )
+    
+    # Match on raw bytes to skip decoding and lower-casing every line
+    for line in result.stdout.splitlines():
+        match = _SONIC_UDP_RE.search(line)
+        if match:
+            return int(match.group(1))
+    
+    return None
+
 
 class OscClient:
-    """Client for sending OSC messages to Sonic Pi."""
+    """
+    Client for sending OSC messages to Sonic Pi.
+    Sockets are opened once and reused by every send: one for the cue port
+    (run_code) and one for the command port (everything else). The command
+    socket is only replaced when port discovery finds that Sonic Pi moved,
+    so callers should keep a single instance rather than create one per call.
+    """
     
     def __init__(self, config: OscConfig):
         """Initialize the OSC client with configuration."""
         self.config = config
-        self._client = None
+        self._sock: Optional[socket.socket] = None
+        self._addr: Optional[Tuple[Any, ...]] = None
         self._last_discovered_port = None
+        # Cached (monotonic time, port) of the last discovery attempt
+        self._discovery: Optional[Tuple[float, Optional[int]]] = None
+        # Set after a failed send; the socket is rebuilt on the next send
+        self._needs_reinit = False
+        
+        # stop_all never carries arguments, so its whole message is fixed
+        self._stop_all_dgram = _osc_prefix(config.stop_all_path, "")
+        
+        # run_code always targets the cue port, so one socket serves every call
+        family, _, _, _, self._cue_addr = socket.getaddrinfo(
+            config.host, config.cue_port, type=socket.SOCK_DGRAM
+        )[0]
+        self._cue_sock = _open_udp_socket(family)
+        
         self._init_client()
         
     def _discover_sonic_pi_port(self) -> Optional[int]:
-        """Discover Sonic Pi's current command port."""
+        """Discover Sonic Pi's current command port, reusing recent results."""
+        now = time.monotonic()
+        if self._discovery is not None and now - self._discovery[0] < DISCOVERY_TTL:
+            return self._discovery[1]
+        
+        port = self._scan_for_sonic_pi_port()
+        self._discovery = (now, port)
+        return port
+    
+    def _scan_for_sonic_pi_port(self) -> Optional[int]:
+        """Scan open sockets for Sonic Pi's command port."""
         try:
-            result = subprocess.run(
-                ["lsof", "-i", "-P", "-n"], 
-                capture_output=True, 
-                text=True, 
-                timeout=3
-            )
-            
-            for line in result.stdout.split('\n'):
-                if 'sonic' in line.lower() and 'UDP' in line and '127.0.0.1:' in line:
-                    # Extract port number
-                    match = re.search(r'127\.0\.0\.1:(\d+)', line)
-                    if match:
-                        port = int(match.group(1))
-                        print(f"INFO: Discovered Sonic Pi port: {port}")
-                        return port
-            
-            print("WARNING: Could not discover Sonic Pi port")
-            return None
-            
+            try:
+                port = _find_sonic_udp_port_proc()
+            except OSError:
+                # No /proc/net/udp (macOS, Windows), so ask lsof instead
+                port = _find_sonic_udp_port_lsof()
         except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError):
-            print("ERROR: Failed to discover Sonic Pi port")
+            logger.error("Failed to discover Sonic Pi port")
+            return None
+        
+        if port is None:
+            logger.warning("Could not discover Sonic Pi port")
             return None
+        
+        logger.info("Discovered Sonic Pi port: %d", port)
+        return port
     
     def _init_client(self):
-        """Initialize or reinitialize the UDP client."""
+        """Initialize or reinitialize the UDP socket."""
         # Try to discover the port if not manually set
         discovered_port = self._discover_sonic_pi_port()
         
         if discovered_port and discovered_port != self._last_discovered_port:
             self.config.port = discovered_port
             self._last_discovered_port = discovered_port
-            print(f"INFO: Using discovered port: {discovered_port}")
+            logger.info("Using discovered port: %d", discovered_port)
+        
+        # A UDP socket survives a failed send; keep it unless the port moved
+        if self._sock is not None and self._addr[1] == self.config.port:
+            self._needs_reinit = False
+            return
         
-        self._client = SimpleUDPClient(self.config.host, self.config.port)
-        print(f"INFO: OSC client initialized - {self.config.host}:{self.config.port}")
+        # Resolve the host once instead of on every sendto
+        family, _, _, _, addr = socket.getaddrinfo(
+            self.config.host, self.config.port, type=socket.SOCK_DGRAM
+        )[0]
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = _open_udp_socket(family)
+        self._addr = addr
+        self._needs_reinit = False
+        logger.info("OSC client initialized - %s:%d", self.config.host, self.config.port)
+    
+    @staticmethod
+    def build_message(address: str, *args) -> bytes:
+        """Serialize an OSC message to its datagram bytes."""
+        # Build message with explicit types
+        builder = OscMessageBuilder(address=address)
+        for arg in args:
+            if isinstance(arg, str):
+                builder.add_arg(arg, 's')
+            elif isinstance(arg, int):
+                builder.add_arg(arg, 'i')
+            elif isinstance(arg, float):
+                builder.add_arg(arg, 'f')
+            else:
+                builder.add_arg(arg)
+        return builder.build().dgram
     
     def send_message(self, address: str, *args) -> None:
-        """Send an OSC message to the specified address."""
+        """Send an OSC message to the specified address; see send_f/send_s for single values."""
+        self._send_dgram(address, self.build_message(address, *args))
+    
+    def send_f(self, address: str, value: float) -> None:
+        """Send an OSC message with a single float argument."""
+        # The address and type tags are cached; only the argument is encoded per call
+        self._send_dgram(address, _osc_prefix(address, "f") + _pack_float(value))
+    
+    def send_s(self, address: str, value: str) -> None:
+        """Send an OSC message with a single string argument."""
+        self._send_dgram(address, _osc_prefix(address, "s") + _osc_string(value))
+    
+    def _send_dgram(self, address: str, dgram: bytes) -> None:
+        """Send an already encoded OSC message."""
         try:
-            # Rediscover port if connection seems to fail
-            if not self._client:
+            # Rediscover port if the previous send failed
+            if not self._sock or self._needs_reinit:
                 self._init_client()
             
-            # Build message with explicit types
-            builder = OscMessageBuilder(address=address)
-            for arg in args:
-                if isinstance(arg, str):
-                    builder.add_arg(arg, 's')
-                elif isinstance(arg, int):
-                    builder.add_arg(arg, 'i')
-                elif isinstance(arg, float):
-                    builder.add_arg(arg, 'f')
-                else:
-                    builder.add_arg(arg)
-            msg = builder.build()
-            self._client.send(msg)
-            print(f"DEBUG: Sent OSC message {address} to {self.config.host}:{self.config.port}")
+            self._sock.sendto(dgram, self._addr)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Sent OSC message %s to %s:%d",
+                             address, self.config.host, self.config.port)
         except Exception as e:
-            print(f"ERROR: Failed to send OSC message to {address}: {e}")
-            # Try to rediscover port and retry once
-            self._init_client()
+            logger.error("Failed to send OSC message to %s: %s", address, e)
+            # Rediscover the port on the next send rather than blocking this one
+            self._needs_reinit = True
             raise
     
     def run_code(self, source: str) -> str:
         """Send code to Sonic Pi for execution."""
-        job_id = str(uuid.uuid4())
-        start_time = time.time()
+        job_id = f"{_PID}-{next(_JOB_COUNTER)}"
+        start_ns = time.perf_counter_ns()
         
         try:
             # Format the code with proper line endings
-            formatted_source = source.strip()
-            
-            # Send to the cue port (4560) which Sonic Pi definitely listens to
-            cue_client = SimpleUDPClient(self.config.host, 4560)
+            dgram = _CODE_PREFIX + _osc_string(source.strip())
             
-            # Send as a cue message that can be received by sync in Sonic Pi
-            cue_builder = OscMessageBuilder(address="/mcp/code")
-            cue_builder.add_arg(formatted_source, 's')
-            cue_msg = cue_builder.build()
-            cue_client.send(cue_msg)
+            # Send to the cue port as a cue message that can be received by sync in Sonic Pi
+            self._cue_sock.sendto(dgram, self._cue_addr)
             
-            print(f"INFO: Sent code to Sonic Pi via /mcp/code (job {job_id})")
+            # Per-message confirmations are DEBUG so the default INFO level skips them
+            logger.debug("Sent code to Sonic Pi via /mcp/code (job %s)", job_id)
             return job_id
         except Exception as e:
-            print(f"ERROR: Failed to run code: {e}")
+            logger.error("Failed to run code: %s", e)
             raise
         finally:
-            elapsed = (time.time() - start_time) * 1000
-            print(f"INFO: Code execution took {elapsed:.2f}ms")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Code execution took %.2fms",
+                            (time.perf_counter_ns() - start_ns) / 1_000_000)
     
     def stop_all(self) -> None:
         """Stop all running jobs."""
         try:
-            self.send_message(self.config.stop_all_path)
-            print("INFO: Sent stop-all command")
+            self._send_dgram(self.config.stop_all_path, self._stop_all_dgram)
+            logger.debug("Sent stop-all command")
         except Exception as e:
-            print(f"ERROR: Failed to stop all jobs: {e}")
+            logger.error("Failed to stop all jobs: %s", e)
             raise
     
     def set_bpm(self, bpm: float) -> None:
         """Set the global BPM."""
         try:
-            self.send_message(self.config.set_bpm_path, bpm)
-            print(f"INFO: Set BPM to {bpm}")
+            self.send_f(self.config.set_bpm_path, bpm)
+            logger.debug("Set BPM to %s", bpm)
         except Exception as e:
-            print(f"ERROR: Failed to set BPM: {e}")
+            logger.error("Failed to set BPM: %s", e)
             raise
     
     def cue(self, tag: str) -> None:
         """Send a cue message."""
         try:
-            self.send_message(self.config.cue_path, tag)
-            print(f"INFO: Sent cue: {tag}")
+            self.send_s(self.config.cue_path, tag)
+            logger.debug("Sent cue: %s", tag)
         except Exception as e:
-            print(f"ERROR: Failed to send cue: {e}")
+            logger.error("Failed to send cue: %s", e)
             raise
@@ -1,6 +1,7 @@
 """Music pattern library for common Sonic Pi structures."""
 
-from typing import Dict, List, Optional
+from string import Formatter
+from typing import Any, Dict, Optional, Tuple
 
 # Common drum patterns
 DRUM_PATTERNS = {
@@ -172,18 +173,40 @@ end
     }
 }
 
+# Pattern tables by category
+_CATEGORIES: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "drums": DRUM_PATTERNS,
+    "bass": BASS_PATTERNS,
+    "chords": CHORD_PROGRESSIONS
+}
+
+
+def _split_on_bpm(code: str) -> Optional[Tuple[str, str]]:
+    """Return the text before and after a template's single {bpm} field, if that is its only one."""
+    pieces = list(Formatter().parse(code))
+    fields = [(field, spec, conversion) for _, field, spec, conversion in pieces
+              if field is not None]
+    if fields != [("bpm", "", None)]:
+        return None
+    # parse() ends the first piece at the first field
+    return pieces[0][0], "".join(literal for literal, _, _, _ in pieces[1:])
+
+
+# Templates whose only placeholder is one plain {bpm}, split around it once at import
+_BPM_SPLIT: Dict[Tuple[str, str], Tuple[str, str]] = {
+    (category, name): split
+    for category, patterns in _CATEGORIES.items()
+    for name, pattern_dict in patterns.items()
+    if (split := _split_on_bpm(pattern_dict["code"])) is not None
+}
+
+
 def get_pattern(category: str, pattern_name: str, **kwargs) -> Optional[str]:
     """Get a pattern by category and name, with optional parameter substitution."""
-    patterns = {
-        "drums": DRUM_PATTERNS,
-        "bass": BASS_PATTERNS,
-        "chords": CHORD_PROGRESSIONS
-    }
-    
-    if category not in patterns:
+    if category not in _CATEGORIES:
         return None
     
-    pattern_dict = patterns[category].get(pattern_name)
+    pattern_dict = _CATEGORIES[category].get(pattern_name)
     if not pattern_dict:
         return None
     
@@ -197,29 +220,25 @@ def get_pattern(category: str, pattern_name: str, **kwargs) -> Optional[str]:
     if "bpm" in kwargs and kwargs["bpm"] is None:
         kwargs["bpm"] = pattern_dict.get("bpm", 120)
     
+    key = (category, pattern_name)
+    split = _BPM_SPLIT.get(key)
+    if split is not None and "bpm" in kwargs:
+        return split[0] + str(kwargs["bpm"]) + split[1]
+    
     try:
         return code.format(**kwargs)
     except KeyError:
         return code
 
-def list_patterns() -> Dict[str, List[str]]:
+def list_patterns() -> Dict[str, Tuple[str, ...]]:
     """List all available patterns by category."""
-    return {
-        "drums": list(DRUM_PATTERNS.keys()),
-        "bass": list(BASS_PATTERNS.keys()),
-        "chords": list(CHORD_PROGRESSIONS.keys())
-    }
+    # Built per call from _CATEGORIES, so callers never share or mutate the library
+    return {category: tuple(patterns) for category, patterns in _CATEGORIES.items()}
 
 def get_pattern_description(category: str, pattern_name: str) -> Optional[str]:
     """Get description of a specific pattern."""
-    patterns = {
-        "drums": DRUM_PATTERNS,
-        "bass": BASS_PATTERNS,
-        "chords": CHORD_PROGRESSIONS
-    }
-    
-    if category not in patterns:
+    if category not in _CATEGORIES:
         return None
     
-    pattern_dict = patterns[category].get(pattern_name)
+    pattern_dict = _CATEGORIES[category].get(pattern_name)
     return pattern_dict["description"] if pattern_dict else None
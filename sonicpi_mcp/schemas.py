@@ -1,11 +1,19 @@
 """Contract definitions for the MCP server tools."""
 
-from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field, PositiveFloat, constr
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, PositiveFloat
+from typing_extensions import TypedDict  # pydantic needs this one on Python < 3.12
 
 
 class SuccessResponse(BaseModel):
-    """Base success response for all tools."""
+    """
+    Base success response for all tools.
+    
+    Responses carry server-produced values of the declared types, so handlers
+    build them with model_construct() and skip validation.
+    """
+    model_config = ConfigDict(defer_build=True)
+    
     ok: bool = True
 
 
@@ -32,8 +40,8 @@ class CueResponse(SuccessResponse):
     tag: str
 
 
-class LogEntry(BaseModel):
-    """Individual log entry for tail_logs."""
+class LogEntry(TypedDict):
+    """Individual log entry for tail_logs; a plain dict instead of a model instance."""
     ts: float
     level: str
     message: str
@@ -45,29 +53,34 @@ class TailLogsResponse(SuccessResponse):
 
 
 # Input schemas
-class RunCodeInput(BaseModel):
+class ToolInput(BaseModel):
+    """Base input for all tools; parsed arguments are read-only."""
+    model_config = ConfigDict(frozen=True)
+
+
+class RunCodeInput(ToolInput):
     """Input for run_code tool."""
     source: str = Field(..., description="Sonic Pi source code to execute")
 
 
-class SetBpmInput(BaseModel):
+class SetBpmInput(ToolInput):
     """Input for set_bpm tool."""
     bpm: PositiveFloat = Field(..., description="Beats per minute")
 
 
-class CueInput(BaseModel):
+class CueInput(ToolInput):
     """Input for cue tool."""
-    tag: constr(min_length=1) = Field(..., description="Cue tag to trigger")
+    tag: str = Field(..., min_length=1, description="Cue tag to trigger")
 
 
-class TailLogsInput(BaseModel):
+class TailLogsInput(ToolInput):
     """Input for tail_logs tool."""
     since_ms: Optional[float] = Field(None, description="Only return logs after this timestamp")
 
 
 class DiagnosticResponse(SuccessResponse):
     """Response from diagnostic tool."""
-    logs: List[Dict[str, str]]
+    logs: List[Dict[str, Any]]
     port_status: Dict[str, Any]
     osc_test: Dict[str, Any]
     command_port: Optional[int]
@@ -76,7 +89,7 @@ class DiagnosticResponse(SuccessResponse):
 
 
 # New AI-powered tools
-class GenerateMusicInput(BaseModel):
+class GenerateMusicInput(ToolInput):
     """Input for generate_music tool."""
     request: str = Field(..., description="Natural language description of desired music")
 
@@ -90,10 +103,10 @@ class GenerateMusicResponse(SuccessResponse):
 
 class ListPatternsResponse(SuccessResponse):
     """Response from list_patterns tool."""
-    patterns: Dict[str, List[str]]
+    patterns: Dict[str, Tuple[str, ...]]
 
 
-class GetPatternInput(BaseModel):
+class GetPatternInput(ToolInput):
     """Input for get_pattern tool."""
     category: str = Field(..., description="Pattern category (drums, bass, chords)")
     pattern_name: str = Field(..., description="Name of the pattern")
@@ -106,7 +119,7 @@ class GetPatternResponse(SuccessResponse):
     description: str
 
 
-class CreateAndPlayInput(BaseModel):
+class CreateAndPlayInput(ToolInput):
     """Input for create_and_play tool."""
     request: str = Field(..., description="Natural language description of desired music")
 
@@ -1,76 +1,240 @@
 """MCP server implementation."""
 
+import errno
 import json
+import logging
 import os
 import re
+import select
 import socket
 import subprocess
 import sys
+import threading
 import time
-from collections import deque
-from dataclasses import dataclass
-from typing import Any, Deque, Dict, List, Optional, Type, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
 
 from pydantic import BaseModel, ValidationError
 
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 from .ai_generator import MusicAI
-from .config import Config, discover_sonic_pi_port, load_config
-# Inline logging and diagnostics functionality
-from .osc_client import OscClient
+from .config import discover_sonic_pi_port, load_config
+from .logging import logger as log_ring, set_level
+from .osc_client import OscClient, find_sonic_pi_socket_port
 from .patterns import get_pattern, list_patterns, get_pattern_description
 from .schemas import (CreateAndPlayInput, CreateAndPlayResponse, CueInput, CueResponse, 
-                     DiagnosticResponse, ErrorResponse, GenerateMusicInput, 
+                     DiagnosticResponse, GenerateMusicInput, 
                      GenerateMusicResponse, GetPatternInput, GetPatternResponse, 
-                     ListPatternsResponse, LogEntry, RunCodeInput, RunCodeResponse, 
-                     SetBpmInput, SetBpmResponse, TailLogsInput, TailLogsResponse)
+                     ListPatternsResponse, RunCodeInput, RunCodeResponse, 
+                     SetBpmInput, SetBpmResponse, SuccessResponse, TailLogsInput, 
+                     TailLogsResponse)
 
+logger = logging.getLogger(__name__)
 
-# Inline logging functionality
-@dataclass
-class LogRecord:
-    """Internal log record structure."""
-    ts: float
-    level: str
-    message: str
+_LSOF_PORT_RE = re.compile(rb":(\d+)\s+\(LISTEN\)")
 
+# Kernel tables of TCP sockets on Linux, and the state code for a listening socket
+PROC_NET_TCP = ("/proc/net/tcp", "/proc/net/tcp6")
+_TCP_LISTEN = "0A"
+
+# Longest wait for a diagnose TCP probe, and connect_ex results meaning "still connecting"
+PORT_PROBE_TIMEOUT = 0.1
+_CONNECT_PENDING = {errno.EINPROGRESS, errno.EWOULDBLOCK,
+                    getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+_WSAECONNREFUSED = getattr(errno, "WSAECONNREFUSED", errno.ECONNREFUSED)
+
+# Seconds a diagnose result is reused, and how long the (slow) command port lookup is trusted
+DIAGNOSTIC_TTL = 3.0
+COMMAND_PORT_TTL = 30.0
+
+# The diagnose OSC test message never changes, so encode it once; sockets are reused per target
+_OSC_TEST_DGRAM = OscClient.build_message("/cue", "test_connection")
+_osc_test_targets: Dict[Tuple[str, int], Tuple[socket.socket, Any]] = {}
+_osc_test_lock = threading.Lock()
+
+# Cached (monotonic time, port) of the last command port lookup
+_command_port_cache: Optional[Tuple[float, Optional[int]]] = None
+
+# JSON-RPC error codes for the internal error names that have one; the rest are -32000
+_JSONRPC_ERROR_CODES = {
+    "UNKNOWN_METHOD": -32601,
+    "INVALID_JSON": -32700,
+    "INVALID_FORMAT": -32602
+}
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize an outgoing message to UTF-8, using orjson's C encoder when it is installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
-class RingLogger:
-    """Ring buffer logger that maintains a fixed number of recent log entries."""
-    
-    def __init__(self, max_entries: int = 1000):
-        """Initialize the logger with a maximum number of entries."""
-        self.buffer: Deque[LogRecord] = deque(maxlen=max_entries)
-    
-    def log(self, level: str, message: str) -> None:
-        """Add a new log entry."""
-        self.buffer.append(LogRecord(
-            ts=time.time() * 1000,  # Convert to milliseconds
-            level=level,
-            message=message
-        ))
-    
-    def get_entries(self, since_ms: Optional[float] = None) -> List[LogEntry]:
-        """Retrieve log entries, optionally filtered by timestamp."""
-        entries = []
-        
-        for record in self.buffer:
-            if since_ms is None or record.ts > since_ms:
-                entries.append(LogEntry(
-                    ts=record.ts,
-                    level=record.level,
-                    message=record.message
-                ))
-        
-        return entries
 
+def _loads(data: bytes) -> Any:
+    """Parse an incoming message; orjson's decode error subclasses json.JSONDecodeError."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
 
-# Global logger instance
-logger = RingLogger()
+
+# Largest read from stdin at once; every complete line in it is handled before flushing
+READ_CHUNK_SIZE = 65536
+
+# Tools advertised by tools/list
+TOOLS = [
+    {
+        "name": "run_code",
+        "description": "Run Sonic Pi code",
+        "inputSchema": {
+            "type": "object",
+            "required": ["source"],
+            "properties": {
+                "source": {
+                    "type": "string",
+                    "description": "Sonic Pi source code to execute"
+                }
+            }
+        }
+    },
+    {
+        "name": "stop_all",
+        "description": "Stop all running jobs",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "set_bpm",
+        "description": "Set the global BPM",
+        "inputSchema": {
+            "type": "object",
+            "required": ["bpm"],
+            "properties": {
+                "bpm": {
+                    "type": "number",
+                    "description": "Beats per minute",
+                    "minimum": 1
+                }
+            }
+        }
+    },
+    {
+        "name": "cue",
+        "description": "Send a cue message",
+        "inputSchema": {
+            "type": "object",
+            "required": ["tag"],
+            "properties": {
+                "tag": {
+                    "type": "string",
+                    "description": "Cue tag to trigger"
+                }
+            }
+        }
+    },
+    {
+        "name": "tail_logs",
+        "description": "Get recent log entries",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "since_ms": {
+                    "type": "number",
+                    "description": "Only return logs after this timestamp"
+                }
+            }
+        }
+    },
+    {
+        "name": "diagnose",
+        "description": "Run diagnostics to check Sonic Pi connection",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "generate_music",
+        "description": "Generate Sonic Pi code from natural language description",
+        "inputSchema": {
+            "type": "object",
+            "required": ["request"],
+            "properties": {
+                "request": {
+                    "type": "string",
+                    "description": "Natural language description of desired music (e.g., 'create a rock drum beat')"
+                }
+            }
+        }
+    },
+    {
+        "name": "list_patterns",
+        "description": "List all available music patterns",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "get_pattern",
+        "description": "Get a specific music pattern",
+        "inputSchema": {
+            "type": "object",
+            "required": ["category", "pattern_name"],
+            "properties": {
+                "category": {
+                    "type": "string",
+                    "description": "Pattern category (drums, bass, chords)"
+                },
+                "pattern_name": {
+                    "type": "string",
+                    "description": "Name of the pattern"
+                },
+                "bpm": {
+                    "type": "number",
+                    "description": "Optional BPM override"
+                }
+            }
+        }
+    },
+    {
+        "name": "create_and_play",
+        "description": "Generate music from natural language and immediately play it",
+        "inputSchema": {
+            "type": "object",
+            "required": ["request"],
+            "properties": {
+                "request": {
+                    "type": "string",
+                    "description": "Natural language description of desired music (e.g., 'create a rock drum beat and play it')"
+                }
+            }
+        }
+    }
+]
+_TOOLS_JSON = _dumps(TOOLS)
 
 
 # Inline diagnostics functionality
-def get_diagnostic_info() -> Dict[str, any]:
-    """Gather all diagnostic information."""
+@lru_cache(maxsize=None)
+def _diagnostic_env() -> Tuple[int, Dict[str, str]]:
+    """
+    Read the OSC settings that diagnose reports, once.
+    Deferred to the first call so values loaded from .env by load_config are seen.
+    """
     # Default Sonic Pi port
     default_port = 4557
     
@@ -82,19 +246,38 @@ def get_diagnostic_info() -> Dict[str, any]:
         except ValueError:
             pass
     
-    # Try to find the command port
-    command_port = find_sonic_pi_command_port()
+    environment = {
+        "SONICPI_OSC_HOST": os.getenv("SONICPI_OSC_HOST", "127.0.0.1"),
+        "SONICPI_OSC_PORT": env_port if env_port is not None else str(default_port)
+    }
+    return default_port, environment
+
+
+def get_diagnostic_info() -> Dict[str, any]:
+    """Gather all diagnostic information."""
+    default_port, environment = _diagnostic_env()
+    
+    # The probes are independent I/O waits, so run them concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        logs = executor.submit(find_sonic_pi_logs)
+        port_status = executor.submit(check_port_status, "127.0.0.1", default_port)
+        osc_test = executor.submit(test_osc_connection, "127.0.0.1", default_port)
+        # Try to find the command port
+        command_port_future = executor.submit(_cached_command_port)
+        command_port = command_port_future.result()
+        # Probe the command port as soon as it is known, overlapping the other probes
+        command_port_status = (
+            executor.submit(check_port_status, "127.0.0.1", command_port)
+            if command_port else None
+        )
     
     return {
-        "logs": find_sonic_pi_logs(),
-        "port_status": check_port_status("127.0.0.1", default_port),
-        "osc_test": test_osc_connection("127.0.0.1", default_port),
+        "logs": logs.result(),
+        "port_status": port_status.result(),
+        "osc_test": osc_test.result(),
         "command_port": command_port,
-        "command_port_status": check_port_status("127.0.0.1", command_port) if command_port else None,
-        "environment": {
-            "SONICPI_OSC_HOST": os.getenv("SONICPI_OSC_HOST", "127.0.0.1"),
-            "SONICPI_OSC_PORT": os.getenv("SONICPI_OSC_PORT", str(default_port))
-        }
+        "command_port_status": command_port_status.result() if command_port_status else None,
+        "environment": dict(environment)
     }
 
 
@@ -108,19 +291,19 @@ def find_sonic_pi_logs() -> List[Dict[str, str]]:
     ]
     
     found_logs = []
+    active_since = time.time() - 300  # Modified in last 5 minutes?
     for path in possible_paths:
-        if path.exists():
-            try:
-                # Get last modification time and size
-                stats = path.stat()
-                found_logs.append({
-                    "path": str(path),
-                    "size": str(stats.st_size),
-                    "modified": time.ctime(stats.st_mtime),
-                    "active": stats.st_mtime > time.time() - 300  # Modified in last 5 minutes?
-                })
-            except OSError:
-                continue
+        try:
+            # One stat both checks existence and gets last modification time and size
+            stats = os.stat(path)
+        except OSError:
+            continue
+        found_logs.append({
+            "path": str(path),
+            "size": str(stats.st_size),
+            "modified": time.ctime(stats.st_mtime),
+            "active": stats.st_mtime > active_since
+        })
     
     return found_logs
 
@@ -128,57 +311,186 @@ def find_sonic_pi_logs() -> List[Dict[str, str]]:
 def check_port_status(host: str, port: int) -> Dict[str, bool]:
     """Check if a port is open and responding."""
     try:
-        # Try to create a socket connection
-        with socket.create_connection((host, port), timeout=1):
+        family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, socket.SOCK_STREAM)
+    except Exception as e:
+        return {"open": False, "error": str(e)}
+    
+    try:
+        # Start the connection without blocking and wait at most PORT_PROBE_TIMEOUT for it
+        sock.setblocking(False)
+        err = sock.connect_ex(addr)
+        if err in _CONNECT_PENDING:
+            _, writable, failed = select.select([], [sock], [sock], PORT_PROBE_TIMEOUT)
+            if not writable and not failed:
+                return {"open": False, "error": "Connection timed out"}
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        
+        if err == 0:
             return {"open": True, "error": None}
-    except socket.timeout:
-        return {"open": False, "error": "Connection timed out"}
-    except ConnectionRefusedError:
-        return {"open": False, "error": "Connection refused"}
+        if err == errno.ECONNREFUSED or err == _WSAECONNREFUSED:
+            return {"open": False, "error": "Connection refused"}
+        return {"open": False, "error": os.strerror(err)}
     except Exception as e:
         return {"open": False, "error": str(e)}
+    finally:
+        sock.close()
+
+
+def _osc_test_target(host: str, port: int) -> Tuple[socket.socket, Any]:
+    """Return the cached socket and resolved address for OSC test messages to host:port."""
+    key = (host, port)
+    with _osc_test_lock:
+        target = _osc_test_targets.get(key)
+        if target is None:
+            family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+            target = _osc_test_targets[key] = (socket.socket(family, socket.SOCK_DGRAM), addr)
+    return target
 
 
 def test_osc_connection(host: str, port: int) -> Dict[str, bool]:
     """Test OSC connection by sending a simple message."""
     try:
-        from pythonosc.udp_client import SimpleUDPClient
-        client = SimpleUDPClient(host, port)
+        sock, addr = _osc_test_target(host, port)
         # Send a cue message as a test
-        client.send_message("/cue", ["test_connection"])
+        sock.sendto(_OSC_TEST_DGRAM, addr)
         return {"sent": True, "error": None}
     except Exception as e:
         return {"sent": False, "error": str(e)}
 
 
+def _cached_command_port() -> Optional[int]:
+    """Return the command port, rescanning only once COMMAND_PORT_TTL has passed."""
+    global _command_port_cache
+    now = time.monotonic()
+    if _command_port_cache is not None and now - _command_port_cache[0] < COMMAND_PORT_TTL:
+        return _command_port_cache[1]
+    
+    port = find_sonic_pi_command_port()
+    _command_port_cache = (now, port)
+    return port
+
+
 def find_sonic_pi_command_port() -> Optional[int]:
     """Try to find Sonic Pi's dynamic command port by checking running processes."""
+    try:
+        return _find_command_port_proc()
+    except OSError:
+        # No /proc/net/tcp outside Linux
+        pass
+    if PSUTIL_AVAILABLE:
+        try:
+            return _find_command_port_psutil()
+        except psutil.Error:
+            # e.g. AccessDenied on macOS without root; lsof may still work
+            pass
+    return _find_command_port_lsof()
+
+
+def _find_command_port_proc() -> Optional[int]:
+    """
+    Find the command port by reading the kernel's TCP tables from /proc.
+    Owners are matched by process name, as in the psutil and lsof lookups.
+    Raises OSError when /proc/net/tcp is not available.
+    """
+    # Map socket inode -> port for every listening TCP socket
+    ports_by_inode = {}
+    for table in PROC_NET_TCP:
+        try:
+            f = open(table)
+        except FileNotFoundError:
+            if table == PROC_NET_TCP[0]:
+                raise
+            continue  # IPv6 disabled
+        with f:
+            next(f)  # Skip the header
+            for line in f:
+                fields = line.split()
+                if fields[3] != _TCP_LISTEN:
+                    continue
+                port = int(fields[1].rsplit(":", 1)[1], 16)
+                # Skip the standard cue port (4560) and look for command port
+                if port != 4560:
+                    ports_by_inode[f"socket:[{fields[9]}]"] = port
+    
+    return find_sonic_pi_socket_port(ports_by_inode, os.getpid())
+
+
+def _find_command_port_psutil() -> Optional[int]:
+    """Find the command port by querying the kernel's socket table via psutil."""
+    for conn in psutil.net_connections(kind="inet"):
+        # Skip the standard cue port (4560) and look for command port
+        if conn.status != psutil.CONN_LISTEN or conn.pid is None or conn.laddr.port == 4560:
+            continue
+        try:
+            name = psutil.Process(conn.pid).name()
+        except psutil.Error:
+            continue
+        if "sonic" in name.lower():
+            return conn.laddr.port
+    return None
+
+
+def _find_command_port_lsof() -> Optional[int]:
+    """Find the command port by scanning `lsof` output."""
     try:
         # Check if Sonic Pi is running and what ports it's using
         result = subprocess.run(
             ["lsof", "-i", "-P", "-n"], 
             capture_output=True, 
-            text=True, 
             timeout=5
         )
         
-        # Look for Sonic Pi processes listening on ports
-        command_port = None
-        for line in result.stdout.split('\n'):
-            if 'sonic' in line.lower() and 'LISTEN' in line:
+        # Look for Sonic Pi processes listening on ports, matching raw bytes to skip decoding.
+        # Only the COMMAND column counts, like the process name in the proc and psutil lookups.
+        for line in result.stdout.splitlines():
+            command = line.split(None, 1)[:1]
+            if command and b'sonic' in command[0].lower():
                 # Extract port number from the line
-                match = re.search(r':(\d+)\s+\(LISTEN\)', line)
+                match = _LSOF_PORT_RE.search(line)
                 if match:
                     port = int(match.group(1))
                     # Skip the standard cue port (4560) and look for command port
                     if port != 4560:
-                        command_port = port
-                        break
+                        return port
         
-        return command_port
+        return None
     except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError):
         return None
 
+@lru_cache(maxsize=256)
+def _lookup_pattern(category: str, pattern_name: str,
+                    bpm: int) -> Tuple[Optional[str], Optional[str]]:
+    """Return (code, description) of a pattern; both depend only on the arguments."""
+    return (get_pattern(category, pattern_name, bpm=bpm),
+            get_pattern_description(category, pattern_name))
+
+@lru_cache(maxsize=64)
+def _unknown_tool_error(tool_name: str) -> bytes:
+    """Encoded JSON-RPC error object for an unknown tool; misconfigured clients repeat these."""
+    return _dumps({
+        "code": _JSONRPC_ERROR_CODES.get("UNKNOWN_TOOL", -32000),
+        "message": f"Unknown tool: {tool_name}"
+    })
+
+def _read_line_batches(fd: int) -> Iterator[List[bytes]]:
+    """
+    Yield the complete lines that arrive with each read of fd.
+    A client that pipelines several requests gets them handled as one batch.
+    """
+    pending = b""
+    while True:
+        chunk = os.read(fd, READ_CHUNK_SIZE)
+        if not chunk:
+            # EOF; a last line without a newline is still a request
+            if pending:
+                yield [pending]
+            return
+        *lines, pending = (pending + chunk).split(b"\n")
+        if lines:
+            yield lines
+
+
 T = TypeVar('T', bound=BaseModel)
 
 
@@ -188,272 +500,260 @@ class McpServer:
     def __init__(self):
         """Initialize the MCP server."""
         self.config = load_config()
+        set_level(self.config.logging.level)
         
         # Try to auto-discover Sonic Pi port
         discovered_port = discover_sonic_pi_port()
         if discovered_port:
             self.config.osc.port = discovered_port
-            logger.log("INFO", f"Auto-discovered Sonic Pi port: {discovered_port}")
+            logger.info("Auto-discovered Sonic Pi port: %d", discovered_port)
         
         self.osc = OscClient(self.config.osc)
-        self.music_ai = MusicAI()
-        logger.log("INFO", "MCP server initialized with AI capabilities")
+        # Replies are already UTF-8 bytes, so write them to the binary stdout; bound once
+        self._out_write = sys.stdout.buffer.write
+        self._out_flush = sys.stdout.buffer.flush
+        # Cached (monotonic time, info) of the last diagnose call
+        self._diag_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        
+        # Dispatch tables, built once instead of on every message; tools map to
+        # (handler, error code reported when the handler raises)
+        self._methods = {
+            "initialize": self._initialize,
+            "tools/list": self._list_tools,
+            "tools/call": self._call_tool
+        }
+        self._handlers = {
+            "run_code": (self.run_code, "RUN_CODE_ERROR"),
+            "stop_all": (self.stop_all, "STOP_ALL_ERROR"),
+            "set_bpm": (self.set_bpm, "SET_BPM_ERROR"),
+            "cue": (self.cue, "CUE_ERROR"),
+            "tail_logs": (self.tail_logs, "TAIL_LOGS_ERROR"),
+            "diagnose": (self.diagnose, "DIAGNOSTIC_ERROR"),
+            "generate_music": (self.generate_music, "GENERATE_MUSIC_ERROR"),
+            "list_patterns": (self.list_patterns, "LIST_PATTERNS_ERROR"),
+            "get_pattern": (self.get_pattern, "GET_PATTERN_ERROR"),
+            "create_and_play": (self.create_and_play, "CREATE_AND_PLAY_ERROR")
+        }
+        logger.info("MCP server initialized with AI capabilities")
+    
+    @cached_property
+    def music_ai(self) -> MusicAI:
+        """Music generator, created on first use; it imports and connects the OpenAI client."""
+        return MusicAI()
     
     def _parse_input(self, data: Dict[str, Any], model: Type[T]) -> T:
         """Parse and validate input against a schema."""
         try:
-            return model.model_validate(data)
+            # Call pydantic-core's compiled validator directly, skipping model_validate's wrapper
+            return model.__pydantic_validator__.validate_python(data)
         except ValidationError as e:
             raise ValueError(f"Invalid input: {e}")
     
+    def _emit(self, payload: bytes) -> None:
+        """Write one protocol message to stdout in a single call; run() flushes after each batch."""
+        self._out_write(payload + b"\n")
+    
     def _reply_jsonrpc(self, request_id: Optional[int], result: Any) -> None:
         """Send a JSON-RPC 2.0 result response."""
         if request_id is None:
             return
         envelope = {"jsonrpc": "2.0", "id": request_id, "result": result}
-        print(json.dumps(envelope))
-        sys.stdout.flush()
+        self._emit(_dumps(envelope))
+    
+    def _reply_model(self, request_id: Optional[int], result: BaseModel) -> None:
+        """Send a JSON-RPC 2.0 result response whose result is a response model."""
+        if request_id is None:
+            return
+        # pydantic-core's serializer returns JSON bytes directly; splice them into the envelope
+        self._emit(
+            b'{"jsonrpc":"2.0","id":' + _dumps(request_id)
+            + b',"result":' + result.__pydantic_serializer__.to_json(result) + b"}"
+        )
     
     def _handle_error(self, code: str, message: str, request_id: Optional[int] = None) -> None:
         """Handle an error by sending an error response."""
-        if hasattr(self, '_current_request_id') and self._current_request_id is not None:
-            request_id = self._current_request_id
-        
         # Convert string codes to numeric codes for JSON-RPC compliance
-        numeric_code = -32000  # Generic server error
-        if code == "UNKNOWN_METHOD":
-            numeric_code = -32601
-        elif code == "INVALID_JSON":
-            numeric_code = -32700
-        elif code == "INVALID_FORMAT":
-            numeric_code = -32602
-        
-        response = {
+        numeric_code = _JSONRPC_ERROR_CODES.get(code, -32000)  # Generic server error
+        self._emit(_dumps({
             "jsonrpc": "2.0",
             "id": request_id,
-            "error": {
-                "code": numeric_code,
-                "message": message
-            }
-        }
-        
-        print(json.dumps(response))
-        sys.stdout.flush()
+            "error": {"code": numeric_code, "message": message}
+        }))
     
     def run_code(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle run_code tool invocation."""
-        try:
-            input_data = self._parse_input(args, RunCodeInput)
-            start_time = time.time()
-            job_id = self.osc.run_code(input_data.source)
-            elapsed_ms = (time.time() - start_time) * 1000
-            
-            payload = RunCodeResponse(
-                job_id=job_id,
-                elapsed_ms=elapsed_ms
-            ).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("RUN_CODE_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, RunCodeInput)
+        start_ns = time.perf_counter_ns()
+        job_id = self.osc.run_code(input_data.source)
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
+        
+        payload = RunCodeResponse.model_construct(
+            job_id=job_id,
+            elapsed_ms=elapsed_ms
+        )
+        self._reply_model(request_id, payload)
     
     def stop_all(self, _args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle stop_all tool invocation."""
-        try:
-            self.osc.stop_all()
-            self._reply_jsonrpc(request_id, {"ok": True})
-            
-        except Exception as e:
-            self._handle_error("STOP_ALL_ERROR", str(e), request_id)
+        self.osc.stop_all()
+        self._reply_model(request_id, SuccessResponse.model_construct())
     
     def set_bpm(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle set_bpm tool invocation."""
-        try:
-            input_data = self._parse_input(args, SetBpmInput)
-            self.osc.set_bpm(input_data.bpm)
-            
-            payload = SetBpmResponse(bpm=input_data.bpm).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("SET_BPM_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, SetBpmInput)
+        self.osc.set_bpm(input_data.bpm)
+        
+        payload = SetBpmResponse.model_construct(bpm=input_data.bpm)
+        self._reply_model(request_id, payload)
     
     def cue(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle cue tool invocation."""
-        try:
-            input_data = self._parse_input(args, CueInput)
-            self.osc.cue(input_data.tag)
-            
-            payload = CueResponse(tag=input_data.tag).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("CUE_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, CueInput)
+        self.osc.cue(input_data.tag)
+        
+        payload = CueResponse.model_construct(tag=input_data.tag)
+        self._reply_model(request_id, payload)
     
     def tail_logs(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle tail_logs tool invocation."""
-        try:
-            input_data = self._parse_input(args, TailLogsInput)
-            entries = logger.get_entries(input_data.since_ms)
-            
-            payload = TailLogsResponse(entries=entries).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("TAIL_LOGS_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, TailLogsInput)
+        entries = log_ring.get_entries(input_data.since_ms)
+        
+        payload = TailLogsResponse.model_construct(entries=entries)
+        self._reply_model(request_id, payload)
     
     def diagnose(self, _args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle diagnostic tool invocation."""
-        try:
+        now = time.monotonic()
+        if self._diag_cache is not None and now - self._diag_cache[0] < DIAGNOSTIC_TTL:
+            info = self._diag_cache[1]
+        else:
             info = get_diagnostic_info()
-            payload = DiagnosticResponse(**info).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("DIAGNOSTIC_ERROR", str(e), request_id)
+            self._diag_cache = (now, info)
+        payload = DiagnosticResponse.model_construct(**info)
+        self._reply_model(request_id, payload)
     
     def generate_music(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle generate_music tool invocation."""
-        try:
-            input_data = self._parse_input(args, GenerateMusicInput)
-            code, method_used = self.music_ai.generate_music_code(input_data.request)
-            suggestions = self.music_ai.suggest_improvements(input_data.request)
-            
-            payload = GenerateMusicResponse(
-                code=code,
-                method_used=method_used,
-                suggestions=suggestions
-            ).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("GENERATE_MUSIC_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, GenerateMusicInput)
+        elements = self.music_ai.parse_request(input_data.request)
+        code, method_used = self.music_ai.generate_music_code(input_data.request, elements)
+        suggestions = self.music_ai.suggest_improvements(input_data.request, elements)
+        
+        payload = GenerateMusicResponse.model_construct(
+            code=code,
+            method_used=method_used,
+            suggestions=suggestions
+        )
+        self._reply_model(request_id, payload)
     
     def list_patterns(self, _args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle list_patterns tool invocation."""
-        try:
-            patterns = list_patterns()
-            payload = ListPatternsResponse(patterns=patterns).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("LIST_PATTERNS_ERROR", str(e), request_id)
+        patterns = list_patterns()
+        payload = ListPatternsResponse.model_construct(patterns=patterns)
+        self._reply_model(request_id, payload)
     
     def get_pattern(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle get_pattern tool invocation."""
-        try:
-            input_data = self._parse_input(args, GetPatternInput)
-            code = get_pattern(
-                input_data.category, 
-                input_data.pattern_name,
-                bpm=input_data.bpm or 120
+        input_data = self._parse_input(args, GetPatternInput)
+        code, description = _lookup_pattern(
+            input_data.category, 
+            input_data.pattern_name,
+            input_data.bpm or 120
+        )
+        
+        if not code:
+            self._handle_error(
+                "PATTERN_NOT_FOUND",
+                f"Pattern '{input_data.pattern_name}' not found in category '{input_data.category}'",
+                request_id
             )
-            
-            if not code:
-                self._handle_error(
-                    "PATTERN_NOT_FOUND",
-                    f"Pattern '{input_data.pattern_name}' not found in category '{input_data.category}'",
-                    request_id
-                )
-                return
-            
-            description = get_pattern_description(input_data.category, input_data.pattern_name)
-            
-            payload = GetPatternResponse(
-                code=code,
-                description=description or "No description available"
-            ).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("GET_PATTERN_ERROR", str(e), request_id)
+            return
+        
+        payload = GetPatternResponse.model_construct(
+            code=code,
+            description=description or "No description available"
+        )
+        self._reply_model(request_id, payload)
     
     def create_and_play(self, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle create_and_play tool invocation - generates and immediately plays music."""
-        try:
-            input_data = self._parse_input(args, CreateAndPlayInput)
-            
-            # Generate the music code
-            code, method_used = self.music_ai.generate_music_code(input_data.request)
-            suggestions = self.music_ai.suggest_improvements(input_data.request)
-            
-            # Execute the code immediately
-            start_time = time.time()
-            job_id = self.osc.run_code(code)
-            elapsed_ms = (time.time() - start_time) * 1000
-            
-            payload = CreateAndPlayResponse(
-                code=code,
-                method_used=method_used,
-                job_id=job_id,
-                elapsed_ms=elapsed_ms,
-                suggestions=suggestions
-            ).model_dump()
-            self._reply_jsonrpc(request_id, payload)
-            
-        except Exception as e:
-            self._handle_error("CREATE_AND_PLAY_ERROR", str(e), request_id)
+        input_data = self._parse_input(args, CreateAndPlayInput)
+        
+        # Generate the music code, parsing the request only once
+        elements = self.music_ai.parse_request(input_data.request)
+        code, method_used = self.music_ai.generate_music_code(input_data.request, elements)
+        suggestions = self.music_ai.suggest_improvements(input_data.request, elements)
+        
+        # Execute the code immediately
+        start_ns = time.perf_counter_ns()
+        job_id = self.osc.run_code(code)
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
+        
+        payload = CreateAndPlayResponse.model_construct(
+            code=code,
+            method_used=method_used,
+            job_id=job_id,
+            elapsed_ms=elapsed_ms,
+            suggestions=suggestions
+        )
+        self._reply_model(request_id, payload)
     
     def run(self) -> None:
         """Run the MCP server, processing stdin commands."""
         # Remove the invalid "ready" message - MCP clients expect initialize first
         
-        while True:
-            try:
-                line = sys.stdin.readline()
-                if not line:
-                    break
-                
-                command = json.loads(line)
-                
-                # Handle MCP protocol messages
-                if "method" in command:
-                    self._handle_mcp_message(command)
-                # Handle legacy tool format
-                elif "tool" in command:
-                    tool = command.get("tool")
-                    args = command.get("args", {})
-                    self._handle_tool_call(tool, args)
-                else:
-                    self._handle_error(
-                        "INVALID_FORMAT",
-                        "Expected 'method' or 'tool' field"
-                    )
-                    
-            except json.JSONDecodeError:
-                self._handle_error(
-                    "INVALID_JSON",
-                    "Invalid JSON input"
-                )
-            except Exception as e:
+        # Looked up once rather than per line
+        handle_line = self._handle_line
+        flush = self._out_flush
+        try:
+            for lines in _read_line_batches(sys.stdin.fileno()):
+                for line in lines:
+                    handle_line(line)
+                # Replies are buffered while a batch is handled; send them before blocking again
+                flush()
+        finally:
+            # Don't drop replies already written for a batch if the loop is interrupted
+            flush()
+    
+    def _handle_line(self, line: bytes) -> None:
+        """Parse and dispatch one line of input."""
+        try:
+            command = _loads(line)
+            
+            # Handle MCP protocol messages
+            if "method" in command:
+                self._handle_mcp_message(command)
+            # Handle legacy tool format
+            elif "tool" in command:
+                tool = command.get("tool")
+                args = command.get("args", {})
+                self._handle_tool_call(tool, args)
+            else:
                 self._handle_error(
-                    "INTERNAL_ERROR",
-                    f"Internal error: {e}"
+                    "INVALID_FORMAT",
+                    "Expected 'method' or 'tool' field"
                 )
+                
+        except json.JSONDecodeError:
+            self._handle_error(
+                "INVALID_JSON",
+                "Invalid JSON input"
+            )
+        except Exception as e:
+            self._handle_error(
+                "INTERNAL_ERROR",
+                f"Internal error: {e}"
+            )
     
     def _handle_mcp_message(self, command: Dict[str, Any]) -> None:
         """Handle MCP protocol messages."""
         method = command.get("method")
-        params = command.get("params", {})
         request_id = command.get("id")
         
-        if method == "initialize":
-            self._reply_jsonrpc(request_id, {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {}
-                },
-                "serverInfo": {
-                    "name": "sonicpi",
-                    "version": "0.1.0"
-                }
-            })
-        elif method == "tools/list":
-            self._list_tools(request_id)
-        elif method == "tools/call":
-            tool_name = params.get("name")
-            tool_args = params.get("arguments", {})
-            self._handle_tool_call(tool_name, tool_args, request_id)
+        handler = self._methods.get(method)
+        if handler:
+            handler(command.get("params", {}), request_id)
         else:
             self._handle_error(
                 "UNKNOWN_METHOD",
@@ -461,174 +761,45 @@ class McpServer:
                 request_id
             )
     
-    def _list_tools(self, request_id: Optional[int] = None) -> None:
-        """List available tools."""
-        tools = [
-            {
-                "name": "run_code",
-                "description": "Run Sonic Pi code",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["source"],
-                    "properties": {
-                        "source": {
-                            "type": "string",
-                            "description": "Sonic Pi source code to execute"
-                        }
-                    }
-                }
+    def _initialize(self, _params: Dict[str, Any], request_id: Optional[int] = None) -> None:
+        """Answer the MCP initialize handshake."""
+        self._reply_jsonrpc(request_id, {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {}
             },
-            {
-                "name": "stop_all",
-                "description": "Stop all running jobs",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "set_bpm",
-                "description": "Set the global BPM",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["bpm"],
-                    "properties": {
-                        "bpm": {
-                            "type": "number",
-                            "description": "Beats per minute",
-                            "minimum": 1
-                        }
-                    }
-                }
-            },
-            {
-                "name": "cue",
-                "description": "Send a cue message",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["tag"],
-                    "properties": {
-                        "tag": {
-                            "type": "string",
-                            "description": "Cue tag to trigger"
-                        }
-                    }
-                }
-            },
-            {
-                "name": "tail_logs",
-                "description": "Get recent log entries",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "since_ms": {
-                            "type": "number",
-                            "description": "Only return logs after this timestamp"
-                        }
-                    }
-                }
-            },
-            {
-                "name": "diagnose",
-                "description": "Run diagnostics to check Sonic Pi connection",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "generate_music",
-                "description": "Generate Sonic Pi code from natural language description",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["request"],
-                    "properties": {
-                        "request": {
-                            "type": "string",
-                            "description": "Natural language description of desired music (e.g., 'create a rock drum beat')"
-                        }
-                    }
-                }
-            },
-            {
-                "name": "list_patterns",
-                "description": "List all available music patterns",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_pattern",
-                "description": "Get a specific music pattern",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["category", "pattern_name"],
-                    "properties": {
-                        "category": {
-                            "type": "string",
-                            "description": "Pattern category (drums, bass, chords)"
-                        },
-                        "pattern_name": {
-                            "type": "string",
-                            "description": "Name of the pattern"
-                        },
-                        "bpm": {
-                            "type": "number",
-                            "description": "Optional BPM override"
-                        }
-                    }
-                }
-            },
-            {
-                "name": "create_and_play",
-                "description": "Generate music from natural language and immediately play it",
-                "inputSchema": {
-                    "type": "object",
-                    "required": ["request"],
-                    "properties": {
-                        "request": {
-                            "type": "string",
-                            "description": "Natural language description of desired music (e.g., 'create a rock drum beat and play it')"
-                        }
-                    }
-                }
-            }
-        ]
-        
-        response = {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "tools": tools
+            "serverInfo": {
+                "name": "sonicpi",
+                "version": "0.1.0"
             }
-        }
-        print(json.dumps(response))
-        sys.stdout.flush()
+        })
+    
+    def _list_tools(self, _params: Dict[str, Any], request_id: Optional[int] = None) -> None:
+        """List available tools."""
+        # The tool list is static, so only the request id is serialized per call
+        self._emit(
+            b'{"jsonrpc":"2.0","id":' + _dumps(request_id)
+            + b',"result":{"tools":' + _TOOLS_JSON + b"}}"
+        )
+    
+    def _call_tool(self, params: Dict[str, Any], request_id: Optional[int] = None) -> None:
+        """Handle an MCP tools/call request."""
+        tool_name = params.get("name")
+        tool_args = params.get("arguments", {})
+        self._handle_tool_call(tool_name, tool_args, request_id)
     
     def _handle_tool_call(self, tool_name: str, args: Dict[str, Any], request_id: Optional[int] = None) -> None:
         """Handle tool invocation."""
-        handlers = {
-            "run_code": self.run_code,
-            "stop_all": self.stop_all,
-            "set_bpm": self.set_bpm,
-            "cue": self.cue,
-            "tail_logs": self.tail_logs,
-            "diagnose": self.diagnose,
-            "generate_music": self.generate_music,
-            "list_patterns": self.list_patterns,
-            "get_pattern": self.get_pattern,
-            "create_and_play": self.create_and_play
-        }
-        
-        handler = handlers.get(tool_name)
-        if handler:
-            # Store request_id for response formatting
-            self._current_request_id = request_id
-            handler(args, request_id)  # Pass request_id to all handlers
+        entry = self._handlers.get(tool_name)
+        if entry:
+            handler, error_code = entry
+            # Handlers raise on failure; every tool reports errors through this one path
+            try:
+                handler(args, request_id)  # Pass request_id to all handlers
+            except Exception as e:
+                self._handle_error(error_code, str(e), request_id)
         else:
-            self._handle_error(
-                "UNKNOWN_TOOL",
-                f"Unknown tool: {tool_name}",
-                request_id
+            self._emit(
+                b'{"jsonrpc":"2.0","id":' + _dumps(request_id)
+                + b',"error":' + _unknown_tool_error(tool_name) + b"}"
             )